@@ -1,6 +1,7 @@
 from pydantic_settings import BaseSettings
 from dotenv import load_dotenv
 import os
+from typing import Optional
 
 # ✅ Load the .env file from root (one level up from app/)
 env_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '.env'))
@@ -9,6 +10,40 @@ load_dotenv(dotenv_path=env_path)
 class Settings(BaseSettings):
     DATABASE_URL: str
     LLM_MODEL_PATH: str 
+    # SQLAlchemy connection pool
+    DB_POOL_SIZE: int = 20
+    DB_MAX_OVERFLOW: int = 40
+    DB_POOL_RECYCLE: int = 1800
+    # Load and warm up the model at startup instead of on the first /chat request.
+    LLM_PRELOAD: bool = True
+    # Compile the decode step over a static KV cache (CUDA only).
+    LLM_COMPILE: bool = False
+    # bitsandbytes weight quantization: "4bit", "8bit" or unset (CUDA only).
+    LLM_QUANTIZATION: Optional[str] = None
+    # Inference backend: "transformers", "ctranslate2" (needs CT2_MODEL_PATH)
+    # or "onnxruntime" (exported once to ONNX_MODEL_PATH; USE_INT8 quantizes it).
+    LLM_BACKEND: str = "transformers"
+    CT2_MODEL_PATH: Optional[str] = None
+    ONNX_MODEL_PATH: Optional[str] = None
+    USE_INT8: bool = False
+    # Constrain filter generation to the FilterSpec JSON schema (lm-format-enforcer).
+    LLM_CONSTRAINED_DECODING: bool = False
+    # Reuse the KV cache of the static filter-prompt prefix (bypasses micro-batching).
+    LLM_PREFIX_CACHE: bool = False
+    # Micro-batching of concurrent LLM calls; LLM_BATCH_SIZE=1 disables it.
+    LLM_BATCH_SIZE: int = 8
+    LLM_BATCH_WAIT_MS: int = 15
+    # Generate /chat summaries with the LLM (larger result sets only); the
+    # templated summary is the default, leaving the LLM to filter extraction.
+    USE_LLM_SUMMARY: bool = False
+    # In-process cache of serialized /books responses.
+    BOOKS_CACHE_SIZE: int = 1024
+    BOOKS_CACHE_TTL: int = 300
+    # Seconds a filtered /books COUNT(*) is reused (unfiltered counts use the planner estimate).
+    COUNT_CACHE_TTL: int = 60
+    # Shared cache for extracted /chat filters across uvicorn workers.
+    REDIS_URL: Optional[str] = None
+    FILTER_CACHE_TTL: int = 24 * 60 * 60
 
     class Config:
         env_file = env_path
@@ -1,65 +1,289 @@
+import base64
+import binascii
+from threading import Lock
+
+import orjson
+from cachetools import TTLCache
 from sqlalchemy.orm import Session
-from sqlalchemy import or_, func
-from typing import Dict, List
+from sqlalchemy import Text, and_, distinct, literal_column, or_, func, select, text, tuple_
+from sqlalchemy.dialects.postgresql import ARRAY, aggregate_order_by
+from typing import Any, Dict, List, Optional, Tuple
+
+from app import database
+from app.config import settings
+from app.models import (
+    Book, Author, Subject, Bookshelf, Format, Language,
+    book_authors, book_subjects, book_bookshelves, book_languages, book_search,
+)
+
+
+def _json_array(target, columns, *where):
+    """
+    Correlated subquery returning a book's related rows as a JSON array of
+    objects with the given columns (ordered by id, '[]' when there are none).
+    """
+    obj = func.json_build_object(*[arg for c in columns for arg in (literal_column(f"'{c.key}'"), c)])
+    return (
+        select(func.coalesce(func.json_agg(aggregate_order_by(obj, target.id)), literal_column("'[]'::json")))
+        .where(*where)
+        .correlate(Book)
+        .scalar_subquery()
+    )
+
+
+def _lower_names(target, *where):
+    """Correlated subquery: a book's related names, lowercased, as a text[] ('{}' when none)."""
+    return (
+        select(func.coalesce(
+            func.array_agg(aggregate_order_by(func.lower(target.name), target.id)),
+            literal_column("'{}'::text[]"),
+        ))
+        .where(*where)
+        .correlate(Book)
+        .scalar_subquery()
+    )
+
+
+# Everything BookOut serializes, as flat columns: one row per book, each
+# relationship pre-aggregated to JSON, so no ORM objects are hydrated.
+_BOOK_OUT_COLUMNS = (
+    Book.id,
+    Book.title,
+    Book.download_count,
+    _json_array(
+        Author, (Author.id, Author.name, Author.birth_year, Author.death_year),
+        book_authors.c.author_id == Author.id, book_authors.c.book_id == Book.id,
+    ).label("authors"),
+    _json_array(
+        Subject, (Subject.id, Subject.name),
+        book_subjects.c.subject_id == Subject.id, book_subjects.c.book_id == Book.id,
+    ).label("subjects"),
+    _json_array(
+        Bookshelf, (Bookshelf.id, Bookshelf.name),
+        book_bookshelves.c.bookshelf_id == Bookshelf.id, book_bookshelves.c.book_id == Book.id,
+    ).label("bookshelves"),
+    _json_array(
+        Language, (Language.id, Language.code),
+        book_languages.c.language_id == Language.id, book_languages.c.book_id == Book.id,
+    ).label("languages"),
+    _json_array(Format, (Format.mime_type, Format.url), Format.book_id == Book.id).label("formats"),
+    _lower_names(
+        Subject, book_subjects.c.subject_id == Subject.id, book_subjects.c.book_id == Book.id,
+    ).op("||")(_lower_names(
+        Bookshelf, book_bookshelves.c.bookshelf_id == Bookshelf.id, book_bookshelves.c.book_id == Book.id,
+    )).label("topic_names"),
+)
+
+# Keyset position in the default ordering: (download_count, id) of the last book served.
+Cursor = Tuple[Optional[int], int]
+
+
+def encode_cursor(book: Dict[str, Any]) -> str:
+    """Opaque, URL-safe cursor pointing just past the given book."""
+    return base64.urlsafe_b64encode(orjson.dumps([book["download_count"], book["id"]])).decode()
+
+
+def decode_cursor(cursor: str) -> Cursor:
+    """Inverse of encode_cursor; raises ValueError for anything it did not produce."""
+    try:
+        download_count, book_id = orjson.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (binascii.Error, TypeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+    if not isinstance(book_id, int) or not (download_count is None or isinstance(download_count, int)):
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+    return download_count, book_id
+
+
+def _after_cursor(cursor: Cursor):
+    """
+    Rows after the cursor in ORDER BY download_count DESC NULLS LAST, id DESC.
+    The row-value comparison seeks the index; books without a download count sort last.
+    """
+    download_count, book_id = cursor
+    if download_count is None:
+        return and_(Book.download_count.is_(None), Book.id < book_id)
+    return or_(
+        tuple_(Book.download_count, Book.id) < tuple_(download_count, book_id),
+        Book.download_count.is_(None),
+    )
+
+
+def _like_pattern(term: str) -> str:
+    """'%term%' with the LIKE wildcards in the user's term escaped so they match literally."""
+    escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+def _contains(column, term: str):
+    """
+    Case-insensitive substring match as a plain ILIKE on the column, which the
+    pg_trgm GIN index serves directly (no lower() wrapping).
+    """
+    return column.ilike(_like_pattern(term), escape="\\")
+
+
+def _contains_lc(column, term: str):
+    """
+    Like _contains, for columns stored lowercased: the term is folded once and
+    matched with a case-sensitive LIKE, so no row is case-folded at query time.
+    The term is folded by Postgres lower(), as the column was, so both agree
+    under any LC_CTYPE.
+    """
+    return column.like(func.lower(_like_pattern(term)), escape="\\")
+
+
+def _as_list(value) -> list:
+    return value if isinstance(value, list) else [value]
+
+
+def _topic_predicates(topics: List[str]) -> list:
+    return [
+        or_(
+            Book.subjects.any(_contains(Subject.name, topic)),
+            Book.bookshelves.any(_contains(Bookshelf.name, topic))
+        )
+        for topic in topics
+    ]
+
+
+# (filter key, predicate builder, needs book_search) in ascending estimated cost:
+# the primary-key IN list and GIN array overlaps narrow the candidate rows before
+# any trigram substring match runs, and the widest substring filter (title) comes
+# last. All but ids and title read the one-row-per-book book_search view: `&&` on
+# its language/mime arrays (OR across the requested values) and one trigram probe
+# on its newline-joined, pre-lowercased names, instead of EXISTS through the join tables.
+_FILTERS = (
+    ("ids", lambda ids: [Book.id.in_(ids)], False),
+    ("language", lambda codes: [book_search.c.lang_codes.overlap(codes)], True),
+    ("mime_type", lambda mime: [book_search.c.mime_types.overlap(_as_list(mime))], True),
+    ("author", lambda names: [_contains_lc(book_search.c.authors_lc, name) for name in names], True),
+    ("topic", lambda topics: [_contains_lc(book_search.c.topics_lc, topic) for topic in topics], True),
+    ("title", lambda titles: [_contains(Book.title, t) for t in titles], False),
+)
+
+# The same filters as EXISTS subqueries through the join tables, for databases
+# without the book_search view (see database.healthcheck).
+_EXISTS_FILTERS = (
+    ("ids", lambda ids: [Book.id.in_(ids)], False),
+    ("language", lambda codes: [Book.languages.any(Language.code.in_(codes))], False),
+    ("mime_type", lambda mime: [Book.formats.any(Format.mime_type.in_(_as_list(mime)))], False),
+    ("author", lambda names: [Book.authors.any(_contains(Author.name, name)) for name in names], False),
+    ("topic", _topic_predicates, False),
+    ("title", lambda titles: [_contains(Book.title, t) for t in titles], False),
+)
+
+
+# Recent COUNT(*) results per filter set; the catalog changes only on a reload.
+_COUNT_CACHE: "TTLCache[tuple, int]" = TTLCache(maxsize=1024, ttl=settings.COUNT_CACHE_TTL)
+_COUNT_CACHE_LOCK = Lock()
+
+
+def filters_key(filters: Dict[str, Any]) -> tuple:
+    """Hashable, order-independent form of a filters dict, for cache keys."""
+    return tuple((k, tuple(v) if isinstance(v, list) else v) for k, v in sorted(filters.items()))
+
+
+def _count_books(db: Session, query, filters: Dict[str, Any]) -> int:
+    """
+    Number of books matching the filters. Unfiltered, this is the planner's
+    row estimate for books_book (kept current by ANALYZE) rather than a full
+    COUNT(*); filtered counts are cached for COUNT_CACHE_TTL seconds.
+    """
+    if not filters:
+        estimate = db.execute(
+            text("SELECT reltuples::bigint FROM pg_class WHERE oid = 'books_book'::regclass")
+        ).scalar()
+        # -1 (or 0) until the table has been analyzed: fall back to counting.
+        if estimate and estimate > 0:
+            return estimate
+    key = filters_key(filters)
+    with _COUNT_CACHE_LOCK:
+        total = _COUNT_CACHE.get(key)
+    if total is None:
+        total = query.count()
+        with _COUNT_CACHE_LOCK:
+            _COUNT_CACHE[key] = total
+    return total
 
-from app.models import Book, Author, Subject, Bookshelf, Format, Language
 
 def get_books(
     db: Session,
     filters: Dict[str, List[str]],
     skip: int = 0,
-    limit: int = 25
-) -> (int, List[Book]):
+    limit: int = 25,
+    cursor: Optional[Cursor] = None
+) -> (int, List[Dict[str, Any]]):
     """
-    Returns (total_count, list_of_books) matching the given filters.
+    Returns (total_count, list_of_books) matching the given filters; each book
+    is a plain dict shaped like schemas.BookOut. With a cursor (see
+    decode_cursor) the page starts right after it and skip is ignored.
     """
     query = db.query(Book)
+    filter_table = _FILTERS if database.book_search_ready else _EXISTS_FILTERS
+
+    # book_search has exactly one row per book, so joining it never duplicates books.
+    if any(needs_view and key in filters for key, _, needs_view in filter_table):
+        query = query.join(book_search, book_search.c.id == Book.id)
+
+    # Apply filters, cheapest and most selective first
+    for key, predicates, _ in filter_table:
+        if key in filters:
+            query = query.filter(*predicates(filters[key]))
+
+    ordered = query.order_by(Book.download_count.desc().nullslast(), Book.id.desc())
 
-    # Apply filters
-    if 'ids' in filters:
-        query = query.filter(Book.id.in_(filters['ids']))
-
-    if 'language' in filters:
-        query = query.filter(Book.languages.any(Language.code.in_(filters['language'])))
-
-    if 'mime_type' in filters:
-        query = query.filter(Book.formats.any(Format.mime_type == filters['mime_type']))
-
-    if 'topic' in filters:
-        for topic in filters['topic']:
-            query = query.filter(
-                or_(
-                    Book.subjects.any(Subject.name.ilike(f"%{topic}%")),
-                    Book.bookshelves.any(Bookshelf.name.ilike(f"%{topic}%"))
-                )
-            )
-
-    if 'author' in filters:
-        for name in filters['author']:
-            query = query.filter(Book.authors.any(Author.name.ilike(f"%{name}%")))
-
-    if 'title' in filters:
-        for t in filters['title']:
-            query = query.filter(Book.title.ilike(f"%{t}%"))
-
-    # --- Count unique books ---
-    total = query.with_entities(Book.id).distinct().count()
-
-    # --- Get paginated unique IDs in order ---
-    subq = (
-        query.with_entities(Book.id, Book.download_count)
-        .order_by(Book.download_count.desc().nullslast())
-        .distinct()
+    # --- Keyset pages and the unfiltered list: count from the estimate/cache ---
+    # A window count would only see the rows past a cursor, and without filters
+    # it would make Postgres read the whole table instead of the index top-K.
+    if cursor is not None or not filters:
+        total = _count_books(db, query, filters)
+        page = ordered.filter(_after_cursor(cursor)) if cursor is not None else ordered.offset(skip)
+        rows = page.with_entities(*_BOOK_OUT_COLUMNS).limit(limit).all()
+        return total, [row._asdict() for row in rows]
+
+    # --- Fetch one page and the total in a single round trip ---
+    # Filters are plain predicates, EXISTS subqueries or the one-to-one book_search
+    # join, so each book appears at most once and the window count over the
+    # filtered rows is the number of matching books.
+    rows = (
+        ordered.with_entities(*_BOOK_OUT_COLUMNS, func.count().over().label("total"))
         .offset(skip)
         .limit(limit)
-        .subquery()
-    )
-    # Now fetch Book objects in the same order as subq
-    books = (
-        db.query(Book)
-        .join(subq, Book.id == subq.c.id)
-        .order_by(subq.c.download_count.desc().nullslast())
         .all()
     )
+    if rows:
+        books = [row._asdict() for row in rows]
+        for book in books:
+            del book["total"]
+        with _COUNT_CACHE_LOCK:
+            _COUNT_CACHE[filters_key(filters)] = rows[0].total
+        return rows[0].total, books
+
+    # Past the last page there is no row to carry the window count.
+    total = _count_books(db, query, filters) if skip else 0
+    return total, []
+
 
-    return total, books
\ No newline at end of file
+def summary_stats(db: Session, book_ids: List[int]):
+    """
+    Returns a row (count, authors, titles, top_title, top_author) for the given
+    books, aggregated in SQL: authors and titles are comma-separated lists of
+    distinct names; top_title and top_author (its first author) describe
+    book_ids[0], the top-ranked book.
+    """
+    top = Book.id == book_ids[0]
+    return (
+        db.query(
+            func.count(distinct(Book.id)).label("count"),
+            func.string_agg(distinct(Author.name), ", ").label("authors"),
+            func.string_agg(distinct(Book.title), ", ").label("titles"),
+            func.max(Book.title).filter(top).label("top_title"),
+            func.array_agg(aggregate_order_by(Author.name, Author.id), type_=ARRAY(Text))
+            .filter(and_(top, Author.id.isnot(None)))[1]
+            .label("top_author"),
+        )
+        .select_from(Book)
+        .outerjoin(Book.authors)
+        .filter(Book.id.in_(book_ids))
+        .one()
+    )
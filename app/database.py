@@ -8,30 +8,56 @@ import logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Confirm DB URL
-logger.info(f"Connecting to DB")
+# Create SQLAlchemy engine; the pool is sized for FastAPI's threadpool concurrency
+engine = create_engine(
+    settings.DATABASE_URL,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_pre_ping=True,  # transparently replace connections dropped by the server/network
+    pool_recycle=settings.DB_POOL_RECYCLE,
+    echo=False,
+)
 
-# Create SQLAlchemy engine
-engine = create_engine(settings.DATABASE_URL, echo=False)
+# ORM setup
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+Base = declarative_base()
 
-# Confirm DB connection and list tables
-try:
-    with engine.connect() as conn:
-        logger.info("✅ Connected to the database engine.")
-        result = conn.execute(text("SELECT 1"))
-        logger.info("✅ Test query succeeded: SELECT 1 = %s", result.scalar())
+# Whether the book_search materialized view (migrations/0005) exists with the
+# columns app.models maps; set by healthcheck(). Until then, and otherwise, crud
+# filters through the join tables.
+book_search_ready = False
+
+def healthcheck():
+    """
+    Confirms the DB is reachable and has tables, and records whether the
+    book_search view exists and is current. Run from the app's startup hook, i.e. once per
+    worker after fork, instead of at import time.
+    """
+    global book_search_ready
+    try:
+        with engine.connect() as conn:
+            logger.info("✅ Connected to the database engine.")
+            result = conn.execute(text("SELECT 1"))
+            logger.info("✅ Test query succeeded: SELECT 1 = %s", result.scalar())
 
-        inspector = inspect(engine)
-        table_names = inspector.get_table_names()
+            inspector = inspect(conn)
+            table_names = inspector.get_table_names()
 
-        if not table_names:
-            logger.warning("⚠️ No tables found! Did you run migrations or load a dump?")
-except Exception as e:
-    logger.error("❌ Failed to connect or inspect the DB: %s", e)
+            if not table_names:
+                logger.warning("⚠️ No tables found! Did you run migrations or load a dump?")
 
-# ORM setup
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-Base = declarative_base()
+            # Imported here: app.models itself imports Base from this module.
+            from app.models import book_search
+            book_search_ready = inspector.has_table("book_search") and {
+                c.name for c in book_search.columns
+            } <= {c["name"] for c in inspector.get_columns("book_search")}
+            if not book_search_ready:
+                logger.warning(
+                    "⚠️ book_search view missing or outdated; filtering through the join tables. "
+                    "Apply migrations/*.sql for the faster filters."
+                )
+    except Exception as e:
+        logger.error("❌ Failed to connect or inspect the DB: %s", e)
 
 def get_db():
     """
@@ -5,29 +5,78 @@ A robust LLM-driven filter-and-summary module for Gutendex.
 
 Features:
 - Thread-safe model initialization
+- FlashAttention-2 / SDPA attention instead of the eager path
+- bf16 weights where supported (IPEX-optimized on CPU when installed)
+- Optional 4-bit / 8-bit bitsandbytes quantization (LLM_QUANTIZATION)
+- Optional static KV cache + torch.compile'd decode step (LLM_COMPILE)
+- Optional CTranslate2 int8 backend (LLM_BACKEND=ctranslate2)
+- Optional ONNX Runtime backend, int8 with USE_INT8 (LLM_BACKEND=onnxruntime)
+- Micro-batching of concurrent requests into one model.generate (LLM_BATCH_SIZE)
 - Controlled sampling (temperature, top-p, top-k, repetition penalty)
-- Multi-candidate generation with best-candidate selection
-- Explicit handling for 'most downloaded', 'latest', and 'top N' queries
+- Greedy, single-candidate generation for JSON filters
+- Regex fast path ('most downloaded', 'top N', 'latest', 'by <author>', ...) before the LLM
+- LRU (and optional Redis) cache of extracted filters per normalized query
 - Sanitization and JSON-only output between clear markers
+- Optional JSON-schema-constrained filter decoding (LLM_CONSTRAINED_DECODING)
+- Optional reuse of the static filter-prompt prefix's KV cache (LLM_PREFIX_CACHE)
+- Token streaming of summaries (stream_summary)
 - Example usage at bottom
 """
-import json
+import importlib.util
 import logging
+import os
+import queue
 import re
-from threading import Lock
-from typing import Any, Dict, List, Optional
+import time
+from concurrent.futures import Future
+from functools import lru_cache
+from threading import Lock, Thread
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple, Union
 
+import orjson
 import torch
-from transformers import AutoModelForCausalLM, AutoTokenizer, GenerationConfig
+from transformers import (
+    AutoModelForCausalLM,
+    AutoTokenizer,
+    BitsAndBytesConfig,
+    GenerationConfig,
+    StoppingCriteria,
+    StoppingCriteriaList,
+    TextIteratorStreamer,
+)
+from transformers.utils import is_flash_attn_2_available
 
 from app.config import settings
+from app.schemas import FilterSpec
 
 logger = logging.getLogger(__name__)
 
 # Thread-safe singletons
 _model: Optional[AutoModelForCausalLM] = None
 _tokenizer: Optional[AutoTokenizer] = None
+_generator = None  # ctranslate2.Generator when LLM_BACKEND=ctranslate2
+_redis = None  # shared filter cache when REDIS_URL is set
+_enforcer_tokenizer_data = None  # lm-format-enforcer vocabulary index, built on first use
+_prefix_cache = None  # (input_ids, past_key_values) of _FILTER_PROMPT_PREFIX
+_prefix_lock = Lock()
 _lock = Lock()
+# Held around every forward pass on _model. The batcher worker, the prefix-cache
+# and constrained paths and summary streaming all run on different threads, and
+# with LLM_COMPILE the static KV cache and CUDA graphs are shared model state.
+_generate_lock = Lock()
+_static_cache = False
+# Token ids read once in init_model instead of on every generate call.
+_eos_token_id: Optional[int] = None
+_pad_token_id: Optional[int] = None
+
+# Prompts are padded to this length when the decode step is compiled, so every
+# call sees the same shapes and torch.compile never recompiles.
+STATIC_PROMPT_LENGTH = 256
+# Hard cap on prompt tokens otherwise, so a pathological query cannot inflate prefill.
+MAX_PROMPT_LENGTH = 512
+# Generation budgets: a filter object is ~20 tokens, a summary one or two sentences.
+FILTER_MAX_NEW_TOKENS = 64
+SUMMARY_MAX_NEW_TOKENS = 40
 
 
 def _device() -> str:
@@ -35,21 +84,139 @@ def _device() -> str:
     return "cuda" if torch.cuda.is_available() else "cpu"
 
 
+def _attn_implementation() -> str:
+    """Utility: FlashAttention-2 on CUDA when flash_attn is installed, else SDPA."""
+    if torch.cuda.is_available() and is_flash_attn_2_available():
+        return "flash_attention_2"
+    return "sdpa"
+
+
+def _ipex_available() -> bool:
+    """Utility: True when intel_extension_for_pytorch is installed."""
+    return importlib.util.find_spec("intel_extension_for_pytorch") is not None
+
+
+def _torch_dtype() -> torch.dtype:
+    """
+    Utility: bf16 on GPUs that support it (fp16 otherwise), and bf16 on CPU only
+    when IPEX is available to supply AMX/AVX-512-BF16 kernels; fp32 otherwise.
+    """
+    if torch.cuda.is_available():
+        return torch.bfloat16 if torch.cuda.is_bf16_supported() else torch.float16
+    return torch.bfloat16 if _ipex_available() else torch.float32
+
+
+def _quantization_config() -> Optional[BitsAndBytesConfig]:
+    """Utility: bitsandbytes config for LLM_QUANTIZATION, or None to load fp16/fp32 weights."""
+    if not settings.LLM_QUANTIZATION or not torch.cuda.is_available():
+        return None
+    if settings.LLM_QUANTIZATION == "8bit":
+        return BitsAndBytesConfig(load_in_8bit=True)
+    if settings.LLM_QUANTIZATION == "4bit":
+        return BitsAndBytesConfig(
+            load_in_4bit=True,
+            bnb_4bit_quant_type="nf4",
+            bnb_4bit_compute_dtype=_torch_dtype(),
+            bnb_4bit_use_double_quant=True,
+        )
+    raise ValueError(f"Unsupported LLM_QUANTIZATION: {settings.LLM_QUANTIZATION!r}")
+
+
+def _load_ort_model():
+    """
+    Export LLM_MODEL_PATH to ONNX once (into ONNX_MODEL_PATH) and load it into
+    an ONNX Runtime session with full graph optimizations. With USE_INT8 the
+    export is dynamically quantized to int8 weights first, also only once.
+    """
+    import onnxruntime
+    from optimum.onnxruntime import ORTModelForCausalLM, ORTQuantizer
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+
+    export_dir = settings.ONNX_MODEL_PATH or f"{settings.LLM_MODEL_PATH.rstrip('/')}-onnx"
+    if not os.path.isdir(export_dir):
+        ORTModelForCausalLM.from_pretrained(
+            settings.LLM_MODEL_PATH, export=True, trust_remote_code=True
+        ).save_pretrained(export_dir)
+    model_dir, file_name = export_dir, "model.onnx"
+    if settings.USE_INT8:
+        # int8 is not faster on every CPU; benchmark before enabling per deploy.
+        model_dir, file_name = os.path.join(export_dir, "int8"), "model_quantized.onnx"
+        if not os.path.isdir(model_dir):
+            quantizer = ORTQuantizer.from_pretrained(export_dir)
+            qconfig = AutoQuantizationConfig.avx512_vnni(is_static=False, per_channel=False)
+            quantizer.quantize(save_dir=model_dir, quantization_config=qconfig)
+
+    session_options = onnxruntime.SessionOptions()
+    session_options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+    session_options.intra_op_num_threads = max(1, (os.cpu_count() or 2) // 2)
+    return ORTModelForCausalLM.from_pretrained(
+        model_dir,
+        file_name=file_name,
+        session_options=session_options,
+        provider=("CUDAExecutionProvider" if torch.cuda.is_available() else "CPUExecutionProvider"),
+    )
+
+
 def init_model():
     """
     Load model and tokenizer once, in a thread-safe manner.
     """
-    global _model, _tokenizer
+    global _model, _tokenizer, _generator, _static_cache, _eos_token_id, _pad_token_id
+    # Double-checked: once loaded, every call returns without touching the lock.
+    # The model/generator is published last below, only once it is fully prepared.
+    if _tokenizer is not None and (_model is not None or _generator is not None):
+        return
     with _lock:
-        if _model is None or _tokenizer is None:
+        if (_model is None and _generator is None) or _tokenizer is None:
             _tokenizer = AutoTokenizer.from_pretrained(
                 settings.LLM_MODEL_PATH, trust_remote_code=True
             )
-            _model = AutoModelForCausalLM.from_pretrained(
+            if _tokenizer.pad_token is None:
+                _tokenizer.pad_token = _tokenizer.eos_token
+            _tokenizer.padding_side = "left"
+            # Over-long prompts lose their oldest text, never the query and the
+            # "<<<FILTER>>>" cue the completion starts from.
+            _tokenizer.truncation_side = "left"
+            _tokenizer.model_max_length = MAX_PROMPT_LENGTH
+            _eos_token_id = _tokenizer.eos_token_id
+            _pad_token_id = _tokenizer.pad_token_id
+            if settings.LLM_BACKEND == "ctranslate2":
+                import ctranslate2
+
+                # Converted once with:
+                #   ct2-transformers-converter --model $LLM_MODEL_PATH --quantization int8 --output_dir $CT2_MODEL_PATH
+                _generator = ctranslate2.Generator(
+                    settings.CT2_MODEL_PATH,
+                    device=_device(),
+                    compute_type=("int8_float16" if torch.cuda.is_available() else "int8"),
+                )
+                return
+            if settings.LLM_BACKEND == "onnxruntime":
+                _model = _load_ort_model()
+                return
+            quantization_config = _quantization_config()
+            model = AutoModelForCausalLM.from_pretrained(
                 settings.LLM_MODEL_PATH,
                 trust_remote_code=True,
-                torch_dtype=(torch.float16 if torch.cuda.is_available() else torch.float32),
-            ).to(_device())
+                torch_dtype=_torch_dtype(),
+                attn_implementation=_attn_implementation(),
+                quantization_config=quantization_config,
+                # Quantized weights are placed by accelerate and cannot be moved with .to().
+                device_map=("auto" if quantization_config is not None else None),
+            )
+            if quantization_config is None:
+                model = model.to(_device())
+            model.eval()
+            if not torch.cuda.is_available() and _ipex_available():
+                import intel_extension_for_pytorch as ipex
+
+                model = ipex.llm.optimize(model, dtype=torch.bfloat16)
+            if settings.LLM_COMPILE and torch.cuda.is_available():
+                model.generation_config.cache_implementation = "static"
+                model.forward = torch.compile(model.forward, mode="reduce-overhead", fullgraph=True)
+                _static_cache = True
+            # Publish only the fully prepared model: readers skip the lock.
+            _model = model
 
 
 def generate_text(
@@ -59,45 +226,375 @@ def generate_text(
     top_p: float = 0.9,
     top_k: int = 50,
     repetition_penalty: float = 1.2,
-    num_return_sequences: int = 3
+    num_return_sequences: int = 1,
+    stop_at_json: bool = False
 ) -> List[str]:
     """
-    Generate multiple sampled outputs from the model.
+    Generate one or more completions (new text only, without the prompt);
+    temperature <= 0 decodes greedily. Concurrent calls are micro-batched into one forward pass (see _GenerationBatcher).
+    stop_at_json ends each completion as soon as it holds a closed JSON object.
     """
     init_model()
-    inputs = _tokenizer(prompt, return_tensors='pt').to(_device())
-    gen_cfg = GenerationConfig(
+    if _generator is not None:
+        return _generate_ct2(
+            prompt, max_new_tokens, temperature, top_p, top_k, repetition_penalty, num_return_sequences
+        )
+    sampling = (temperature, top_p, top_k, repetition_penalty, num_return_sequences, stop_at_json)
+    if settings.LLM_BATCH_SIZE > 1:
+        return _batcher.submit(prompt, max_new_tokens, sampling).result()
+    return generate_batch([prompt], max_new_tokens, *sampling)[0]
+
+
+def _generation_config(
+    max_new_tokens: int,
+    temperature: float,
+    top_p: float,
+    top_k: int,
+    repetition_penalty: float,
+    num_return_sequences: int
+) -> GenerationConfig:
+    """Utility: GenerationConfig for the given knobs; temperature <= 0 means greedy."""
+    do_sample = temperature > 0
+    sampling = dict(temperature=temperature, top_p=top_p, top_k=top_k) if do_sample else {}
+    return GenerationConfig(
         max_new_tokens=max_new_tokens,
-        temperature=temperature,
-        top_p=top_p,
-        top_k=top_k,
         repetition_penalty=repetition_penalty,
-        do_sample=True,
+        do_sample=do_sample,
         num_return_sequences=num_return_sequences,
-        eos_token_id=_tokenizer.eos_token_id
+        **sampling,
+        eos_token_id=_eos_token_id,
+        pad_token_id=_pad_token_id,
+        use_cache=True
+    )
+
+
+def generate_batch(
+    prompts: List[str],
+    max_new_tokens: Union[int, List[int]] = 128,
+    temperature: float = 0.7,
+    top_p: float = 0.9,
+    top_k: int = 50,
+    repetition_penalty: float = 1.2,
+    num_return_sequences: int = 1,
+    stop_at_json: bool = False
+) -> List[List[str]]:
+    """
+    Run one left-padded model.generate over several prompts that share the
+    same sampling settings; returns the candidates for each prompt, in order.
+    max_new_tokens may be given per prompt: the batch decodes up to the largest
+    budget and each prompt's output is cut back to its own.
+    """
+    init_model()
+    budgets = max_new_tokens if isinstance(max_new_tokens, list) else [max_new_tokens] * len(prompts)
+    if _static_cache:
+        inputs = _tokenizer(
+            prompts,
+            return_tensors='pt',
+            padding='max_length',
+            max_length=STATIC_PROMPT_LENGTH,
+            truncation=True,
+        ).to(_model.device)
+    else:
+        inputs = _tokenizer(
+            prompts,
+            return_tensors='pt',
+            padding=True,
+            max_length=MAX_PROMPT_LENGTH,
+            truncation=True,
+        ).to(_model.device)
+    gen_cfg = _generation_config(
+        max(budgets), temperature, top_p, top_k, repetition_penalty, num_return_sequences
+    )
+    stopping = (
+        StoppingCriteriaList([_JsonObjectStop(inputs["input_ids"].shape[1])]) if stop_at_json else None
     )
-    with torch.no_grad():
-        outputs = _model.generate(**inputs, generation_config=gen_cfg)
-    return [_tokenizer.decode(out, skip_special_tokens=True) for out in outputs]
+    with _generate_lock, torch.inference_mode():
+        outputs = _model.generate(
+            **inputs, generation_config=gen_cfg, stopping_criteria=stopping, return_dict_in_generate=True
+        )
+    # Decode only the generated tokens; the (left-padded) prompt is never re-stringified.
+    new_tokens = outputs.sequences[:, inputs["input_ids"].shape[1]:]
+    # generate() returns the num_return_sequences candidates of each prompt contiguously.
+    return [
+        [
+            _tokenizer.decode(out[:budget], skip_special_tokens=True)
+            for out in new_tokens[i * num_return_sequences:(i + 1) * num_return_sequences]
+        ]
+        for i, budget in enumerate(budgets)
+    ]
+
+
+def _closes_json_object(text: str) -> bool:
+    """True once text contains a complete top-level {...} (braces inside strings ignored)."""
+    depth, in_string, escaped = 0, False, False
+    for ch in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"' and depth:
+            in_string = True
+        elif ch == "{":
+            depth += 1
+        elif ch == "}" and depth:
+            depth -= 1
+            if not depth:
+                return True
+    return False
+
+
+class _JsonObjectStop(StoppingCriteria):
+    """
+    Per-row stop for filter generation: a row is done once its completion
+    closes the JSON object, instead of running on to max_new_tokens.
+    """
+
+    def __init__(self, prompt_length: int):
+        self.prompt_length = prompt_length
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs) -> torch.BoolTensor:
+        texts = _tokenizer.batch_decode(input_ids[:, self.prompt_length:], skip_special_tokens=True)
+        return torch.tensor([_closes_json_object(t) for t in texts], dtype=torch.bool, device=input_ids.device)
+
+
+class _GenerationBatcher:
+    """
+    Background worker that groups concurrent generate_text calls. It waits up to
+    LLM_BATCH_WAIT_MS for up to LLM_BATCH_SIZE requests, then runs each group of
+    requests with identical sampling settings as a single generate_batch call
+    (token budgets may differ within a group).
+    """
+
+    def __init__(self):
+        self._queue: "queue.Queue[Tuple[str, int, tuple, Future]]" = queue.Queue()
+        self._thread: Optional[Thread] = None
+        self._start_lock = Lock()
+
+    def submit(self, prompt: str, max_new_tokens: int, sampling: tuple) -> Future:
+        self._ensure_started()
+        future: Future = Future()
+        self._queue.put((prompt, max_new_tokens, sampling, future))
+        return future
+
+    def start(self):
+        self._ensure_started()
+
+    def _ensure_started(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = Thread(target=self._run, name="llm-batcher", daemon=True)
+                self._thread.start()
+
+    def _collect(self) -> List[Tuple[str, int, tuple, Future]]:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + settings.LLM_BATCH_WAIT_MS / 1000
+        while len(batch) < settings.LLM_BATCH_SIZE:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            groups: Dict[tuple, List[Tuple[str, int, tuple, Future]]] = {}
+            for item in self._collect():
+                groups.setdefault(item[2], []).append(item)
+            for sampling, items in groups.items():
+                try:
+                    results = generate_batch(
+                        [prompt for prompt, _, _, _ in items],
+                        [budget for _, budget, _, _ in items],
+                        *sampling,
+                    )
+                except Exception as e:
+                    for *_, future in items:
+                        future.set_exception(e)
+                    continue
+                for (*_, future), result in zip(items, results):
+                    future.set_result(result)
+
+
+_batcher = _GenerationBatcher()
+
+
+def start_batcher():
+    """
+    Start the micro-batching worker up front (from the app's startup hook)
+    rather than on the first /chat request.
+    """
+    if settings.LLM_BATCH_SIZE > 1:
+        _batcher.start()
+
+
+def warmup():
+    """
+    Load the model and run one tiny generation so the first /chat request
+    does not pay for weight loading, kernel selection or compilation.
+    """
+    init_model()
+    generate_text("warmup", max_new_tokens=4, temperature=0.0)
+
+
+def _generate_ct2(
+    prompt: str,
+    max_new_tokens: int,
+    temperature: float,
+    top_p: float,
+    top_k: int,
+    repetition_penalty: float,
+    num_return_sequences: int
+) -> List[str]:
+    """
+    generate_text on the CTranslate2 backend. Each candidate is its own batch
+    entry, since CTranslate2 only returns several hypotheses from beam search.
+    """
+    if temperature <= 0:
+        temperature, top_k = 1.0, 1  # greedy
+    tokens = _tokenizer.convert_ids_to_tokens(_tokenizer.encode(prompt))
+    results = _generator.generate_batch(
+        [tokens] * num_return_sequences,
+        max_length=max_new_tokens,
+        sampling_temperature=temperature,
+        sampling_topp=top_p,
+        sampling_topk=top_k,
+        repetition_penalty=repetition_penalty,
+        include_prompt_in_result=False,
+    )
+    return [_tokenizer.decode(r.sequences_ids[0], skip_special_tokens=True) for r in results]
+
+
+# Languages recognised by the "in <language>" fast-path rule.
+LANGUAGE_CODES = {
+    "english": "en", "french": "fr", "german": "de", "spanish": "es", "italian": "it",
+    "portuguese": "pt", "dutch": "nl", "finnish": "fi", "latin": "la", "chinese": "zh",
+}
+
+# Precompiled patterns for the per-request hot path.
+_RE_WHITESPACE = re.compile(r"\s+")
+_RE_TOP = re.compile(r"\bmost downloaded\b|\btop \d+\b", re.IGNORECASE)
+_RE_TOP_N = re.compile(r"top (\d+)", re.IGNORECASE)
+_RE_LATEST = re.compile(r"\blatest\b", re.IGNORECASE)
+_RE_LATEST_N = re.compile(r"latest (\d+)", re.IGNORECASE)
+_RE_DIGITS = re.compile(r"\d+")
+# Completions start right after the <<<FILTER>>> marker, so the JSON leads the text.
+_RE_FILTER_BLOCK = re.compile(r"^\s*(\{.*?\})", re.DOTALL)
+
+# Prompt templates, built once; each call only fills in the placeholders.
+_FILTER_PROMPT_PREFIX = (
+    "Allowed keys: author, title, language, topic, mime_type, ids, sort, limit, download_count.\n"
+    "Output only one valid JSON object, no extra text, between <<<FILTER>>> and <<<END>>>.\n"
+)
+_FILTER_PROMPT_TAIL = "Query: {query}\n<<<FILTER>>>"
+_FILTER_PROMPT_TEMPLATE = _FILTER_PROMPT_PREFIX + _FILTER_PROMPT_TAIL
+_SUMMARY_PROMPT_TEMPLATE = (
+    "Summarize the following search result in 1-2 sentences. "
+    "Query: '{query}'. "
+    "Books found: {count}. "
+    "Authors: {authors}. "
+    "Titles: {titles}."
+)
+
+# Words that end a free-text capture such as an author name or title.
+_STOP = r"(?=\s+(?:by|in|about|on|titled|called|from|with)\b|[,.?!;]|$)"
+# Words after "by" that name an ordering, not an author ("top 10 by downloads").
+_NOT_AUTHOR = r"(?!(?:the|downloads?|popularity|date|title|relevance|rating|year|name)\b)"
+
+
+def _top_rule(m: re.Match) -> Dict[str, Any]:
+    n = _RE_TOP_N.search(m.string)
+    return {"sort": "download_count:desc", "limit": int(n.group(1)) if n else 1}
+
+
+def _latest_rule(m: re.Match) -> Dict[str, Any]:
+    n = _RE_LATEST_N.search(m.string)
+    return {"sort": "latest", "limit": int(n.group(1)) if n else 1}
+
+
+# (pattern, extractor) pairs tried in order by _fast_path_filter. Earlier rules
+# win when two set the same scalar key; list values are concatenated.
+_FAST_PATH_RULES: List[Tuple[re.Pattern, Callable[[re.Match], Dict[str, Any]]]] = [
+    (_RE_TOP, _top_rule),
+    (_RE_LATEST, _latest_rule),
+    (re.compile(r"\b(?:all|any) books?\b", re.IGNORECASE),
+     lambda m: {"sort": "download_count:desc"}),
+    (re.compile(r"\bids?\s*(\d+(?:\s*(?:,|and)\s*\d+)*)\b", re.IGNORECASE),
+     lambda m: {"ids": [int(x) for x in _RE_DIGITS.findall(m.group(1))]}),
+    (re.compile(r"\bby\s+" + _NOT_AUTHOR + r"([a-z][\w.' -]*?)" + _STOP, re.IGNORECASE),
+     lambda m: {"author": [m.group(1).strip()]}),
+    (re.compile(r"\bin\s+(" + "|".join(LANGUAGE_CODES) + r")\b", re.IGNORECASE),
+     lambda m: {"language": [LANGUAGE_CODES[m.group(1).lower()]]}),
+    (re.compile(r"\b(?:titled|called)\s+\"?([^\"]+?)\"?" + _STOP, re.IGNORECASE),
+     lambda m: {"title": [m.group(1).strip()]}),
+    (re.compile(r"\babout\s+([\w' -]+?)" + _STOP, re.IGNORECASE),
+     lambda m: {"topic": [m.group(1).strip()]}),
+    (re.compile(r"\b((?:application|text|image|audio)/[\w.+-]+)", re.IGNORECASE),
+     lambda m: {"mime_type": m.group(1).lower()}),
+]
+
+
+def _fast_path_filter(q: str) -> Dict[str, Any]:
+    """
+    Build a filter from the regex rules alone; empty if no rule matched,
+    in which case the LLM has to interpret the query.
+    """
+    result: Dict[str, Any] = {}
+    for pattern, extract in _FAST_PATH_RULES:
+        m = pattern.search(q)
+        if not m:
+            continue
+        for k, v in extract(m).items():
+            if isinstance(v, list):
+                result.setdefault(k, [])
+                result[k] += [x for x in v if x not in result[k]]
+            else:
+                result.setdefault(k, v)
+    return result
+
+
+# Substrings of the query that make a filter key "explicit", mapped to the keys
+# they unlock. "topic" is listed before "top" so the alternation still reports
+# the sort/limit it implies when both start at the same position.
+_EXPLICIT_KEY_TRIGGERS: Dict[str, Tuple[str, ...]] = {
+    'author': ('author',),
+    'title': ('title',),
+    'language': ('language',),
+    'topic': ('topic', 'sort', 'limit'),
+    'top': ('sort', 'limit'),
+    'mime_type': ('mime_type',),
+    'id': ('ids',),
+    'download': ('download_count',),
+    'most downloaded': ('sort', 'limit'),
+    'latest': ('sort', 'limit'),
+}
+# Zero-width lookahead so overlapping triggers ("most downloaded" / "download")
+# are all reported by one left-to-right scan of the query.
+_RE_EXPLICIT_KEYS = re.compile(
+    "(?=(" + "|".join(re.escape(t) for t in _EXPLICIT_KEY_TRIGGERS) + "))"
+)
+
+
+def _explicit_keys(query_lower: str) -> Set[str]:
+    """
+    Filter keys the query mentions explicitly, found in a single pass.
+    """
+    explicit: Set[str] = set()
+    for trigger in set(_RE_EXPLICIT_KEYS.findall(query_lower)):
+        explicit.update(_EXPLICIT_KEY_TRIGGERS[trigger])
+    return explicit
 
 
 def sanitize_filter(filt: Dict[str, Any], query: str) -> Dict[str, Any]:
     """
     Keep only keys that appear explicitly in query (or sort/limit).
     """
-    allowed = {'author', 'title', 'language', 'topic', 'mime_type', 'ids', 'sort', 'limit', 'download_count'}
-    query_lower = query.lower()
-    explicit = set()
-    for k in allowed:
-        if k in ['sort', 'limit']:
-            if any(w in query_lower for w in ('most downloaded', 'latest', 'top')):
-                explicit.add(k)
-        elif k == 'ids' and ('id' in query_lower or 'ids' in query_lower):
-            explicit.add(k)
-        elif k in query_lower:
-            explicit.add(k)
-    if 'download' in query_lower:
-        explicit.add('download_count')
+    explicit = _explicit_keys(query.lower())
     result = {}
     for k, v in filt.items():
         if k in explicit:
@@ -118,81 +615,287 @@ def sanitize_filter(filt: Dict[str, Any], query: str) -> Dict[str, Any]:
     return result
 
 
+def _redis_client():
+    """
+    Lazily connect to the shared filter cache, if REDIS_URL is configured.
+    """
+    global _redis
+    if _redis is None and settings.REDIS_URL:
+        import redis
+
+        _redis = redis.Redis.from_url(settings.REDIS_URL)
+    return _redis
+
+
 def extract_filter(query: str) -> Dict[str, Any]:
     """
     Convert a natural-language query into a Gutendex filter dict.
     Handles:
       - "most downloaded" / "top N" → sort:download_count desc, limit:N
       - "latest" / "latest N" → sort:latest, limit:N
+      - "by <author>", "in <language>", "titled <title>", "about <topic>", mime types
       - Otherwise, uses LLM to produce JSON between <FILTER>…</FILTER>
+    Results are cached per normalized query (in-process LRU, plus Redis when configured).
     """
-    q = query.strip()
-    if re.search(r"\bmost downloaded\b|\btop \d+\b", q, re.IGNORECASE):
-        m = re.search(r"top (\d+)", q, re.IGNORECASE)
-        n = int(m.group(1)) if m else 1
-        return {"sort": "download_count:desc", "limit": n}
-    if re.search(r"\blatest\b", q, re.IGNORECASE):
-        m = re.search(r"latest (\d+)", q, re.IGNORECASE)
-        n = int(m.group(1)) if m else 1
-        return {"sort": "latest", "limit": n}
-    prompt = (
-        "Allowed keys: author, title, language, topic, mime_type, ids, sort, limit, download_count.\n"
-        "Output only one valid JSON object, no extra text, between <<<FILTER>>> and <<<END>>>.\n"
-        f"Query: {q}\n<<<FILTER>>>"
-    )
+    q_key = _RE_WHITESPACE.sub(" ", query.strip().lower())
+    if not q_key:
+        # Nothing to interpret: skip the cache and the model entirely.
+        return {}
     try:
-        candidates = generate_text(prompt, max_new_tokens=120, temperature=0.2, num_return_sequences=2)
-        for raw in candidates:
-            m = re.search(r"<<<FILTER>>>(\{.*?\})<<<END>>>", raw, re.DOTALL)
-            if m:
-                try:
-                    filt = json.loads(m.group(1))
-                    return sanitize_filter(filt, query)
-                except Exception:
-                    continue
-        for raw in candidates:
-            m = re.search(r"(\{.*\})", raw, re.DOTALL)
-            if m:
-                try:
-                    filt = json.loads(m.group(1))
-                    return sanitize_filter(filt, query)
-                except Exception:
-                    continue
+        return orjson.loads(_cached_filter(q_key))
+    except _NoFilter:
+        pass
     except Exception as e:
         logger.error(f"Failed to generate filter: {e}")
     return {}
 
 
-def summarize_results(query: str, books: List[Any]) -> str:
+class _NoFilter(Exception):
+    """Raised by _cached_filter when nothing was extracted, so the miss is never cached."""
+
+
+@lru_cache(maxsize=4096)
+def _cached_filter(q_key: str) -> str:
+    """
+    JSON-encoded filter for a normalized query. Returns a string so callers
+    never share (and mutate) the cached dict; errors propagate uncached.
+    An empty filter (e.g. one bad LLM sample) raises _NoFilter instead of
+    being cached here and in Redis, so the next request tries again.
+    """
+    client = _redis_client()
+    redis_key = f"gutendex:filter:{q_key}"
+    if client is not None:
+        try:
+            hit = client.get(redis_key)
+            if hit is not None:
+                return hit.decode()
+        except Exception as e:
+            logger.warning(f"Filter cache lookup failed: {e}")
+    extracted = _extract_filter_uncached(q_key)
+    if not extracted:
+        raise _NoFilter(q_key)
+    result = orjson.dumps(extracted).decode()
+    if client is not None:
+        try:
+            client.setex(redis_key, settings.FILTER_CACHE_TTL, result)
+        except Exception as e:
+            logger.warning(f"Filter cache store failed: {e}")
+    return result
+
+
+def filter_cache_info() -> Dict[str, int]:
+    """
+    In-process filter cache statistics, for the /chat/cache debug route.
+    """
+    info = _cached_filter.cache_info()
+    return {"hits": info.hits, "misses": info.misses, "maxsize": info.maxsize, "currsize": info.currsize}
+
+
+def _extract_filter_uncached(q: str) -> Dict[str, Any]:
+    """
+    extract_filter without the cache; q is already normalized.
+    """
+    fast = _fast_path_filter(q)
+    if fast:
+        return fast
+    prompt = _FILTER_PROMPT_TEMPLATE.format(query=q)
+    init_model()
+    if settings.LLM_CONSTRAINED_DECODING and _model is not None:
+        # Grammar-constrained output is always valid JSON, so no recovery is needed.
+        return sanitize_filter(orjson.loads(_generate_constrained(prompt, max_new_tokens=FILTER_MAX_NEW_TOKENS)), q)
+    raw = None
+    if settings.LLM_PREFIX_CACHE and _model is not None and not _static_cache:
+        try:
+            raw = _generate_with_prefix_cache(q, max_new_tokens=FILTER_MAX_NEW_TOKENS)
+        except Exception as e:
+            logger.warning(f"Prefix-cached generation failed, using the full prompt: {e}")
+    if raw is None:
+        # Greedy decoding is the most reliable way to get well-formed JSON, so one candidate is enough.
+        raw = generate_text(
+            prompt, max_new_tokens=FILTER_MAX_NEW_TOKENS, temperature=0.0, num_return_sequences=1, stop_at_json=True
+        )[0]
+    m = _RE_FILTER_BLOCK.search(raw)
+    if m:
+        try:
+            return sanitize_filter(orjson.loads(m.group(1)), q)
+        except ValueError:
+            logger.warning(f"LLM returned invalid filter JSON: {m.group(1)!r}")
+    return {}
+
+
+def _filter_prefix_cache():
+    """
+    Token ids and KV cache of the static filter-prompt prefix, computed by one
+    forward pass the first time they are needed.
+    """
+    global _prefix_cache
+    if _prefix_cache is None:
+        with _prefix_lock:
+            if _prefix_cache is None:
+                prefix_ids = _tokenizer(_FILTER_PROMPT_PREFIX, return_tensors='pt').input_ids.to(_model.device)
+                with _generate_lock, torch.inference_mode():
+                    past = _model(prefix_ids, use_cache=True).past_key_values
+                # Keep the immutable tuple form: generate() builds a fresh cache
+                # from it on every call, so the stored tensors are never extended.
+                if hasattr(past, "to_legacy_cache"):
+                    past = past.to_legacy_cache()
+                _prefix_cache = (prefix_ids, past)
+    return _prefix_cache
+
+
+def _generate_with_prefix_cache(q: str, max_new_tokens: int) -> str:
+    """
+    Greedy filter generation that only prefills the per-query tail of the
+    prompt, reusing the cached KV of the static prefix.
+    """
+    prefix_ids, past = _filter_prefix_cache()
+    tail_ids = _tokenizer(
+        _FILTER_PROMPT_TAIL.format(query=q),
+        return_tensors='pt',
+        add_special_tokens=False,
+        max_length=MAX_PROMPT_LENGTH,
+        truncation=True,
+    ).input_ids.to(_model.device)
+    input_ids = torch.cat([prefix_ids, tail_ids], dim=-1)
+    gen_cfg = _generation_config(max_new_tokens, 0.0, 1.0, 0, 1.2, 1)
+    with _generate_lock, torch.inference_mode():
+        out = _model.generate(
+            input_ids=input_ids,
+            attention_mask=torch.ones_like(input_ids),
+            past_key_values=past,
+            generation_config=gen_cfg,
+            stopping_criteria=StoppingCriteriaList([_JsonObjectStop(input_ids.shape[1])]),
+            return_dict_in_generate=True,
+        )
+    return _tokenizer.decode(out.sequences[0, input_ids.shape[1]:], skip_special_tokens=True)
+
+
+def _generate_constrained(prompt: str, max_new_tokens: int) -> str:
+    """
+    Greedy generation restricted to tokens that keep the output a valid
+    FilterSpec JSON object (lm-format-enforcer); returns only the new text.
+    """
+    global _enforcer_tokenizer_data
+    from lmformatenforcer import JsonSchemaParser
+    from lmformatenforcer.integrations.transformers import (
+        build_token_enforcer_tokenizer_data,
+        build_transformers_prefix_allowed_tokens_fn,
+    )
+
+    if _enforcer_tokenizer_data is None:
+        # Scanning the vocabulary is expensive; do it once per process.
+        _enforcer_tokenizer_data = build_token_enforcer_tokenizer_data(_tokenizer)
+    prefix_fn = build_transformers_prefix_allowed_tokens_fn(
+        _enforcer_tokenizer_data, JsonSchemaParser(FilterSpec.model_json_schema())
+    )
+    inputs = _tokenizer(
+        prompt, return_tensors='pt', max_length=MAX_PROMPT_LENGTH, truncation=True
+    ).to(_model.device)
+    gen_cfg = _generation_config(max_new_tokens, 0.0, 1.0, 0, 1.0, 1)
+    with _generate_lock, torch.inference_mode():
+        out = _model.generate(
+            **inputs,
+            generation_config=gen_cfg,
+            prefix_allowed_tokens_fn=prefix_fn,
+            return_dict_in_generate=True,
+        )
+    return _tokenizer.decode(out.sequences[0, inputs["input_ids"].shape[1]:], skip_special_tokens=True)
+
+
+NO_MATCH_SUMMARY = "No books matched your criteria."
+
+# Below either threshold the templated summary is as informative as the LLM's.
+_LLM_SUMMARY_MIN_BOOKS = 6
+_LLM_SUMMARY_MIN_QUERY_WORDS = 4
+
+
+def _should_use_llm(query: str, stats: Any) -> bool:
+    """
+    The LLM only earns its latency on large result sets for longer, more
+    ambiguous queries; anything else is described just as well by
+    _template_summary. USE_LLM_SUMMARY=0 turns it off.
+    """
+    return (
+        settings.USE_LLM_SUMMARY
+        and stats.count >= _LLM_SUMMARY_MIN_BOOKS
+        and len(query.split()) >= _LLM_SUMMARY_MIN_QUERY_WORDS
+    )
+
+
+def _template_summary(query: str, stats: Any) -> str:
+    """Deterministic summary from the summary_stats row: the count and the top-ranked book."""
+    plural = "s" if stats.count != 1 else ""
+    summary = f"Found {stats.count} book{plural} matching '{query}', including {stats.top_title}"
+    if stats.top_author:
+        summary += f" by {stats.top_author}"
+    return summary + "."
+
+
+def summarize_results(query: str, stats: Any) -> str:
     """
     Summarize the overall search result into a concise 1-2 sentence description,
-    without listing individual books.
-    """
-    if not books:
-        return "No books matched your criteria."
-    book_titles = ', '.join([getattr(b, 'title', None) for b in books if getattr(b, 'title', None)])
-    author_names = ', '.join({getattr(a, 'name', None) for b in books for a in getattr(b, 'authors', []) if getattr(a, 'name', None)})
-    prompt = (
-        f"Summarize the following search result in 1-2 sentences. "
-        f"Query: '{query}'. "
-        f"Books found: {len(books)}. "
-        f"Authors: {author_names}. "
-        f"Titles: {book_titles}."
+    without listing individual books. `stats` is the row from
+    crud.summary_stats, or None when nothing matched.
+    """
+    if not stats or not stats.count:
+        return NO_MATCH_SUMMARY
+    if not _should_use_llm(query, stats):
+        return _template_summary(query, stats)
+    prompt = _SUMMARY_PROMPT_TEMPLATE.format(
+        query=query, count=stats.count, authors=stats.authors or "", titles=stats.titles or ""
     )
     try:
-        cands = generate_text(prompt, max_new_tokens=80, temperature=0.8)
+        cands = generate_text(prompt, max_new_tokens=SUMMARY_MAX_NEW_TOKENS, temperature=0.8)
         logger.info(f"LLM summary candidates: {cands}")
         valid = []
         for c in cands:
-            if c.startswith(prompt):
-                c = c[len(prompt):].lstrip("\n: ")
-            if len(c.strip()) > 20:
-                valid.append(c.strip())
+            c = c.lstrip("\n: ").strip()
+            if len(c) > 20:
+                valid.append(c)
         if valid:
             return max(valid, key=len)
     except Exception as e:
         logger.error(f"Summary failed: {e}")
     # Fallback deterministic summary
-    return f"Found {len(books)} books matching your query."
+    return f"Found {stats.count} books matching your query."
 
 
+def stream_summary(query: str, stats: Any) -> Iterator[str]:
+    """
+    Same summary as summarize_results, but yields text chunks as the model
+    decodes them instead of blocking until the whole summary is generated.
+    """
+    if not stats or not stats.count:
+        yield NO_MATCH_SUMMARY
+        return
+    if not _should_use_llm(query, stats):
+        yield _template_summary(query, stats)
+        return
+    init_model()
+    if _generator is not None:
+        # CTranslate2 has no streamer hook; fall back to the blocking summary.
+        yield summarize_results(query, stats)
+        return
+    prompt = _SUMMARY_PROMPT_TEMPLATE.format(
+        query=query, count=stats.count, authors=stats.authors or "", titles=stats.titles or ""
+    )
+    inputs = _tokenizer(
+        prompt, return_tensors='pt', max_length=MAX_PROMPT_LENGTH, truncation=True
+    ).to(_model.device)
+    streamer = TextIteratorStreamer(_tokenizer, skip_prompt=True, skip_special_tokens=True)
+    gen_cfg = _generation_config(SUMMARY_MAX_NEW_TOKENS, 0.8, 0.9, 50, 1.2, 1)
+    Thread(target=_generate_streaming, args=(inputs, gen_cfg, streamer), daemon=True).start()
+    yield from streamer
+
+
+def _generate_streaming(inputs, gen_cfg: GenerationConfig, streamer: TextIteratorStreamer):
+    """
+    Thread target for stream_summary. Always ends the stream, so a failed
+    generation cannot leave the HTTP response waiting forever.
+    """
+    try:
+        with _generate_lock, torch.inference_mode():
+            _model.generate(**inputs, generation_config=gen_cfg, streamer=streamer)
+    except Exception as e:
+        logger.error(f"Streaming summary failed: {e}")
+        streamer.end()
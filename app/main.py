@@ -1,22 +1,59 @@
-from fastapi import FastAPI, Depends, Query, HTTPException, Request
+from fastapi import FastAPI, Depends, Header, Query, HTTPException, Request, Response
 from sqlalchemy.orm import Session
-from typing import List, Optional, Dict, Any
-from app.schemas import BookOut, BookListResponse, ChatBooksResponse, ChatRequest
-from app.database import get_db
+from typing import List, Optional, Dict, Any, Iterator, Tuple
+from app.schemas import BOOK_LIST_ADAPTER, BOOK_LIST_RESPONSE_ADAPTER, validate_books, BookListResponse, ChatBooksResponse, ChatRequest
+from app.config import settings
+from app.database import get_db, healthcheck
 from app import schemas, crud
-from fastapi import Body
 from pydantic import BaseModel
-from app.llm import extract_filter, summarize_results
-from app.crud import get_books
+from app.llm import NO_MATCH_SUMMARY, extract_filter, filter_cache_info, start_batcher, stream_summary, summarize_results, warmup
+import asyncio
+import hashlib
 import logging
-from fastapi.responses import JSONResponse
+import re
+import string
+import orjson
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from cachetools import TTLCache
+from fastapi.responses import JSONResponse, ORJSONResponse, StreamingResponse
+
+# Language codes recognised in /chat queries, and only right after "in" or
+# "language" ("books in fr"): several codes are also words ("it", "de", "es")
+# and must not be taken for a language elsewhere in the query.
+_LANG_SET = frozenset({"en", "fr", "de", "es", "it", "pt", "ru", "zh", "ja"})
+_LANG_RE = re.compile(r"\b(?:in|language)\s*[:=]?\s*(" + "|".join(sorted(_LANG_SET)) + r")\b")
+# A lone word with six consonants in a row ("asdfghjkl") is keyboard noise, not a
+# search; real words top out around five ("nietzsche"), and "y" counts as a vowel.
+_NOISE_RE = re.compile(r"^[a-z]*[bcdfghjklmnpqrstvwxz]{6,}[a-z]*$")
+
+# Dedicated workers for blocking LLM calls from async handlers. Sized so that enough
+# callers can wait on the micro-batcher at once to fill a batch.
+LLM_POOL = ThreadPoolExecutor(max_workers=max(2, settings.LLM_BATCH_SIZE), thread_name_prefix="llm")
+
+# Case folding for the /books cache key. ASCII only: Postgres ILIKE/lower() under
+# a C ctype leave other letters as they are, so "Émile" must not become "émile".
+_ASCII_LOWER = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+# Serialized /books responses and their ETags keyed by the normalized request; handlers run in
+# FastAPI's threadpool, and TTLCache is not thread-safe on its own.
+_BOOKS_CACHE: "TTLCache[tuple, Tuple[bytes, str]]" = TTLCache(maxsize=settings.BOOKS_CACHE_SIZE, ttl=settings.BOOKS_CACHE_TTL)
+_BOOKS_CACHE_LOCK = Lock()
 
 app = FastAPI(
     title="Gutendex API",
     version="1.0.0",
-    description="Query Project Gutenberg books by LLM-driven filters."
+    description="Query Project Gutenberg books by LLM-driven filters.",
+    default_response_class=ORJSONResponse,
 )
 
+@app.on_event("startup")
+def startup():
+    healthcheck()
+    start_batcher()
+    if settings.LLM_PRELOAD:
+        warmup()
+
 @app.exception_handler(404)
 async def not_found_handler(request: Request, exc):
     logging.info(f"404 Not Found: {request.url.path}")
@@ -44,49 +81,105 @@ def list_books(
     topic: Optional[List[str]] = Query(None, description="Search in subjects or bookshelves"),
     author: Optional[List[str]] = Query(None, description="Author name (partial match)"),
     title: Optional[List[str]] = Query(None, description="Book title (partial match)"),
-    skip: int = Query(0, ge=0, description="Number of records to skip"),
+    skip: int = Query(0, ge=0, description="Number of records to skip (deprecated: use cursor)"),
     limit: int = Query(25, ge=1, le=100, description="Max records to return"),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    if_none_match: Optional[str] = Header(None),
     db: Session = Depends(get_db)
 ):
     """
     Retrieve a paginated list of books matching any combination of filters.
-    Results are sorted by descending download count.
+    Results are sorted by descending download count. Page with the returned
+    next_cursor; skip still works but costs a scan of every skipped row.
+    Serialized responses are cached for BOOKS_CACHE_TTL seconds (the catalog is read-only)
+    and carry an ETag of their body; a matching If-None-Match gets an empty 304.
     """
+    # Normalized so equivalent requests share one cache entry: blank values are
+    # dropped, repeats removed and lists sorted; the ILIKE filters are ASCII case-folded.
     filters = {}
-    if ids:       filters['ids'] = ids
-    if language:  filters['language'] = language
+    if ids:       filters['ids'] = sorted(set(ids))
+    if language:  filters['language'] = _normalize(language)
     if mime_type: filters['mime_type'] = mime_type
-    if topic:     filters['topic'] = topic
-    if author:    filters['author'] = author
-    if title:     filters['title'] = title
+    if topic:     filters['topic'] = _normalize(topic, fold_case=True)
+    if author:    filters['author'] = _normalize(author, fold_case=True)
+    if title:     filters['title'] = _normalize(title, fold_case=True)
+    filters = {k: v for k, v in filters.items() if v}
+
+    key = (crud.filters_key(filters), skip, limit, cursor)
+    with _BOOKS_CACHE_LOCK:
+        cached = _BOOKS_CACHE.get(key)
+    if cached is None:
+        body = _list_books_body(db, filters, skip, limit, cursor)
+        cached = (body, f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"')
+        with _BOOKS_CACHE_LOCK:
+            _BOOKS_CACHE[key] = cached
+    body, etag = cached
+    if if_none_match and _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(content=body, media_type="application/json", headers={"ETag": etag})
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    # If-None-Match uses weak comparison: "*" or any listed tag, W/ prefix ignored.
+    tags = {t.strip().removeprefix("W/") for t in if_none_match.split(",")}
+    return "*" in tags or etag in tags
+
+def _normalize(values: List[str], fold_case: bool = False) -> List[str]:
+    return sorted({v.translate(_ASCII_LOWER) if fold_case else v for v in values if v})
+
+def _list_books_body(
+    db: Session, filters: Dict[str, Any], skip: int, limit: int, cursor: Optional[str]
+) -> bytes:
+    """
+    The serialized /books response for already-normalized filters.
+    """
+    try:
+        position = crud.decode_cursor(cursor) if cursor else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
 
     try:
-        total, books = crud.get_books(db, filters, skip, limit)
+        total, books = crud.get_books(db, filters, skip, limit, cursor=position)
     except Exception as e:
         logging.error(f"Error fetching books: {e}")
         raise HTTPException(status_code=500, detail="Error fetching books from the database.")
 
+    next_cursor = crud.encode_cursor(books[-1]) if len(books) == limit else None
     try:
-        books_out = [BookOut.model_validate(b) for b in books]
+        books_out = validate_books(books)
     except Exception as e:
         logging.error(f"Error serializing books: {e}")
         raise HTTPException(status_code=500, detail="Error serializing book data.")
 
-    return {"count": total, "results": books_out}
+    # One pass from validated models to bytes; no intermediate dicts for a JSON encoder.
+    return BOOK_LIST_RESPONSE_ADAPTER.dump_json(
+        BookListResponse(count=total, results=books_out, next_cursor=next_cursor)
+    )
 
 class ChatRequest(BaseModel):
     query: str
 
-@app.post("/chat", response_model=ChatBooksResponse, tags=["AskDB"])
-def chat(request: ChatRequest, db: Session = Depends(get_db)) -> ChatBooksResponse:
+def _is_unsearchable(query: str) -> bool:
     """
-    Handles chat queries, generates filters using LLM, fetches books, and summarizes results.
+    Blank or gibberish queries: answered with the canonical empty result
+    without touching the model or the database.
+    """
+    q = query.strip().lower()
+    return not q or bool(_NOISE_RE.match(q))
+
+def _chat_filters(query: str) -> Dict[str, Any]:
+    """
+    Turns the query into filters (fast path or LLM); 400 if nothing could be parsed.
     """
     # 1) extract deterministic filter
-    filters = extract_filter(request.query)
+    filters = extract_filter(query)
     if not filters:
         raise HTTPException(400, "Sorry, I couldn't parse any filters from that query.")
+    return filters
 
+def _chat_books(query: str, filters: Dict[str, Any], db: Session) -> List[Dict[str, Any]]:
+    """
+    Shared by /chat and /chat/stream: fetches the books matching the extracted filters.
+    """
     # 2) normalize filter values to lists and correct types
     allowed = {"author", "title", "language", "topic", "mime_type", "ids"}
     cleaned: Dict[str, List[Any]] = {}
@@ -105,35 +198,87 @@ def chat(request: ChatRequest, db: Session = Depends(get_db)) -> ChatBooksRespon
                 cleaned[k] = [v]
 
     # --- PATCH: Try to extract language from the user query if not present in filters ---
-    import re
     if "language" not in cleaned:
-        # crude extraction: look for 'fr', 'en', etc. in the query
-        m = re.search(r"\b([a-z]{2})\b", request.query.lower())
+        # look for a language code ('in fr', 'language en', ...) in the query
+        m = _LANG_RE.search(query.lower())
         if m:
-            lang = m.group(1)
-            if lang in {"fr", "en", "de", "es", "it"}:  # add more as needed
-                cleaned["language"] = [lang]
+            cleaned["language"] = [m.group(1)]
 
-    # 3) handle limit and sort from filters
+    # 3) handle limit from filters
     limit = filters.get("limit", 25)
     try:
         limit = int(limit)
     except Exception:
         limit = 25
-    sort = filters.get("sort", None)
 
     # 4) fetch books
-    total, books = crud.get_books(db, cleaned, skip=0, limit=limit)
+    _, books = crud.get_books(db, cleaned, skip=0, limit=limit)
+    return books
+
+def _chat_books_and_stats(query: str, filters: Dict[str, Any], db: Session) -> Tuple[List[Dict[str, Any]], Any]:
+    """
+    Books for the filters plus the SQL-side aggregates the summary is built from.
+    """
+    books = _chat_books(query, filters, db)
+    stats = crud.summary_stats(db, [b["id"] for b in books]) if books else None
+    return books, stats
 
-    # 5) summarize
-    summary = summarize_results(request.query, books)
+@app.post("/chat", response_model=ChatBooksResponse, tags=["AskDB"])
+async def chat(request: ChatRequest, db: Session = Depends(get_db)) -> ChatBooksResponse:
+    """
+    Handles chat queries, generates filters using LLM, fetches books, and summarizes results.
+    LLM and DB work run in worker threads so the event loop keeps serving other requests.
+    """
+    if _is_unsearchable(request.query):
+        return ChatBooksResponse(filters={}, count=0, results=[], summary=NO_MATCH_SUMMARY)
+    loop = asyncio.get_running_loop()
+    filters = await loop.run_in_executor(LLM_POOL, _chat_filters, request.query)
+    # 5) summarize from SQL-side aggregates rather than walking the ORM objects
+    books, stats = await loop.run_in_executor(None, _chat_books_and_stats, request.query, filters, db)
+    summary = await loop.run_in_executor(LLM_POOL, summarize_results, request.query, stats)
     return ChatBooksResponse(
         filters=filters,
         count=len(books),
-        results=[BookOut.model_validate(b) for b in books],
+        results=validate_books(books),
         summary=summary
     )
 
+@app.post("/chat/stream", tags=["AskDB"])
+def chat_stream(request: ChatRequest, db: Session = Depends(get_db)) -> StreamingResponse:
+    """
+    Same query handling as /chat, streamed as NDJSON: one line with the filters and
+    results as soon as the DB answers, then one {"summary": ...} line per generated chunk.
+    """
+    if _is_unsearchable(request.query):
+        empty = orjson.dumps({"filters": {}, "count": 0, "results": []}) + b"\n"
+        return StreamingResponse(
+            iter([empty, orjson.dumps({"summary": NO_MATCH_SUMMARY}) + b"\n"]),
+            media_type="application/x-ndjson",
+        )
+    filters = _chat_filters(request.query)
+    # Aggregate and serialize before streaming: the DB session is released once the handler returns.
+    books, stats = _chat_books_and_stats(request.query, filters, db)
+    head = orjson.dumps({
+        "filters": filters,
+        "count": len(books),
+        "results": BOOK_LIST_ADAPTER.dump_python(validate_books(books), mode="json"),
+    })
+
+    def lines() -> Iterator[bytes]:
+        yield head + b"\n"
+        for chunk in stream_summary(request.query, stats):
+            if chunk:
+                yield orjson.dumps({"summary": chunk}) + b"\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+@app.get("/chat/cache", tags=["AskDB"])
+def chat_cache():
+    """
+    Debug view of the per-worker LRU cache of extracted /chat filters.
+    """
+    return filter_cache_info()
+
 @app.get("/health")
 def health():
     return {"status": "ok"}
\ No newline at end of file
@@ -1,6 +1,7 @@
 from sqlalchemy import (
-    Table, Column, Integer, String, ForeignKey, SmallInteger
+    DDL, MetaData, Table, Column, Integer, String, Text, ForeignKey, SmallInteger, Index, event
 )
+from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.orm import relationship
 from app.database import Base
 
@@ -68,8 +69,48 @@ class Book(Base):
     title = Column(String(1024), nullable=False)
     download_count = Column(Integer, nullable=True)
 
-    authors = relationship('Author', secondary=book_authors, back_populates='books')
-    subjects = relationship('Subject', secondary=book_subjects, back_populates='books')
-    bookshelves = relationship('Bookshelf', secondary=book_bookshelves, back_populates='books')
-    languages = relationship('Language', secondary=book_languages, back_populates='books')
-    formats = relationship('Format', back_populates='book')
+    # crud.get_books reads these pre-aggregated in SQL; any ORM load of books
+    # still batch-loads each collection with one IN query instead of N+1.
+    authors = relationship('Author', secondary=book_authors, back_populates='books', lazy='selectin')
+    subjects = relationship('Subject', secondary=book_subjects, back_populates='books', lazy='selectin')
+    bookshelves = relationship('Bookshelf', secondary=book_bookshelves, back_populates='books', lazy='selectin')
+    languages = relationship('Language', secondary=book_languages, back_populates='books', lazy='selectin')
+    formats = relationship('Format', back_populates='book', lazy='selectin')
+
+# Trigram indexes backing the ILIKE '%term%' filters (migrations/0001_trgm_indexes.sql)
+Index("ix_books_book_title_trgm", Book.title,
+      postgresql_using="gin", postgresql_ops={"title": "gin_trgm_ops"}).ddl_if(dialect="postgresql")
+Index("ix_books_author_name_trgm", Author.name,
+      postgresql_using="gin", postgresql_ops={"name": "gin_trgm_ops"}).ddl_if(dialect="postgresql")
+Index("ix_books_subject_name_trgm", Subject.name,
+      postgresql_using="gin", postgresql_ops={"name": "gin_trgm_ops"}).ddl_if(dialect="postgresql")
+Index("ix_books_bookshelf_name_trgm", Bookshelf.name,
+      postgresql_using="gin", postgresql_ops={"name": "gin_trgm_ops"}).ddl_if(dialect="postgresql")
+
+# Default list order and keyset cursor of crud.get_books (download_count DESC NULLS LAST,
+# id DESC); INCLUDE title makes the unfiltered top-K an index-only scan
+# (migrations/0003_download_count_id_index.sql)
+Index("ix_books_book_download_count_id", Book.download_count.desc().nullslast(), Book.id.desc(),
+      postgresql_include=["title"]).ddl_if(dialect="postgresql")
+
+# gin_trgm_ops needs the extension; make metadata.create_all() (e.g. a fresh test
+# database) work without having run the migrations first.
+event.listen(
+    Base.metadata,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql"),
+)
+
+# Materialized view from migrations/0005_book_search.sql: per-book lowercased
+# search text and codes for the /books filters. Kept out of Base.metadata so create_all() never
+# tries to create it as a table.
+view_metadata = MetaData()
+
+book_search = Table(
+    'book_search', view_metadata,
+    Column('id', Integer, primary_key=True),
+    Column('authors_lc', Text),
+    Column('topics_lc', Text),
+    Column('lang_codes', ARRAY(Text)),
+    Column('mime_types', ARRAY(Text)),
+)
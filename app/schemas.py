@@ -1,5 +1,5 @@
 from typing import List, Dict, Any, Optional
-from pydantic import BaseModel
+from pydantic import BaseModel, TypeAdapter
 
 class AuthorOut(BaseModel):
     id: int
@@ -42,13 +42,49 @@ class BookOut(BaseModel):
     bookshelves: List[BookshelfOut]
     languages: List[LanguageOut]
     formats: List[FormatOut]
+    # Lowercased subject then bookshelf names: what the topic filter matches against.
+    topic_names: List[str] = []
 
     model_config = {"from_attributes": True}
 
+# Validates a whole result list in one pydantic-core call instead of a Python loop.
+BOOK_LIST_ADAPTER = TypeAdapter(List[BookOut])
+
+# Nested lists whose entries recur across the books of one response.
+_SHARED_FIELDS = (
+    ("authors", AuthorOut),
+    ("subjects", SubjectOut),
+    ("bookshelves", BookshelfOut),
+    ("languages", LanguageOut),
+)
+
+def validate_books(rows: List[Dict[str, Any]]) -> List[BookOut]:
+    """
+    Validate crud.get_books rows into BookOut, sharing one instance per distinct
+    author/subject/bookshelf/language id across the response (flyweight)
+    instead of building a copy for every book that references it.
+    """
+    for field, model in _SHARED_FIELDS:
+        cache: Dict[int, BaseModel] = {}
+        for row in rows:
+            shared = []
+            for item in row[field]:
+                obj = cache.get(item["id"])
+                if obj is None:
+                    obj = cache[item["id"]] = model.model_validate(item)
+                shared.append(obj)
+            row[field] = shared
+    return BOOK_LIST_ADAPTER.validate_python(rows)
+
 
 class BookListResponse(BaseModel):
     count: int
     results: List[BookOut]
+    # Pass back as ?cursor= for the next page; None on the last page.
+    next_cursor: Optional[str] = None
+
+# Serializes a validated response straight to JSON bytes in pydantic-core.
+BOOK_LIST_RESPONSE_ADAPTER = TypeAdapter(BookListResponse)
 
 class ChatBooksResponse(BaseModel):
     filters: Dict[str, Any]
@@ -58,3 +94,20 @@ class ChatBooksResponse(BaseModel):
 
 class ChatRequest(BaseModel):
     query: str
+
+class FilterSpec(BaseModel):
+    """
+    The filter object the LLM may emit for /chat; its JSON schema drives
+    constrained decoding in app.llm.
+    """
+    author: Optional[List[str]] = None
+    title: Optional[List[str]] = None
+    language: Optional[List[str]] = None
+    topic: Optional[List[str]] = None
+    mime_type: Optional[str] = None
+    ids: Optional[List[int]] = None
+    sort: Optional[str] = None
+    limit: Optional[int] = None
+    download_count: Optional[int] = None
+
+    model_config = {"extra": "forbid"}
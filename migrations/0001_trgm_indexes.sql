@@ -0,0 +1,13 @@
+-- Trigram GIN indexes so the ILIKE '%term%' filters in app/crud.py get an
+-- index scan instead of a sequential scan. Mirrors the Index() declarations
+-- in app/models.py.
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX IF NOT EXISTS ix_books_book_title_trgm
+    ON books_book USING gin (title gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS ix_books_author_name_trgm
+    ON books_author USING gin (name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS ix_books_subject_name_trgm
+    ON books_subject USING gin (name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS ix_books_bookshelf_name_trgm
+    ON books_bookshelf USING gin (name gin_trgm_ops);
@@ -0,0 +1,6 @@
+-- Covering btree index for the default sort of app/crud.py get_books
+-- (ORDER BY download_count DESC NULLS LAST, id). Postgres reads the top-K rows
+-- straight off the index instead of sorting the whole table, and INCLUDE (title)
+-- lets the unfiltered list be an index-only scan. Mirrors app/models.py.
+CREATE INDEX IF NOT EXISTS ix_books_book_download_count_desc
+    ON books_book (download_count DESC NULLS LAST, id) INCLUDE (title);
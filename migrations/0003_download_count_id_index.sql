@@ -0,0 +1,10 @@
+-- Replaces ix_books_book_download_count_desc (0002) now that get_books breaks
+-- download_count ties by id DESC for keyset pagination: the index key must match
+-- ORDER BY download_count DESC NULLS LAST, id DESC exactly for the planner to
+-- walk it instead of sorting, and for the cursor's row-value predicate to seek.
+-- CONCURRENTLY keeps the table writable; psql runs each statement in its own
+-- transaction, as CONCURRENTLY requires. Mirrors app/models.py.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_books_book_download_count_id
+    ON books_book (download_count DESC NULLS LAST, id DESC) INCLUDE (title);
+
+DROP INDEX CONCURRENTLY IF EXISTS ix_books_book_download_count_desc;
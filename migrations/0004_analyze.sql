@@ -0,0 +1,8 @@
+-- Refresh planner statistics after the index migrations above. Until the
+-- filtered tables are analyzed, the planner can keep estimating the
+-- ILIKE '%term%' filters as a sequential scan and ignore the trigram GIN
+-- indexes from 0001. Cheap and safe to re-run after every data load.
+ANALYZE books_book;
+ANALYZE books_author;
+ANALYZE books_subject;
+ANALYZE books_bookshelf;
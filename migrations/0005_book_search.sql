@@ -0,0 +1,60 @@
+-- Denormalized search text per book, so the author and topic filters in
+-- app/crud.py are one trigram probe on book_search instead of EXISTS
+-- subqueries through two join tables each. Names are newline-separated, so a
+-- search term can only match inside a single name, as it did against the
+-- join tables. The text is stored lowercased (authors_lc, topics_lc), so those
+-- filters are a case-sensitive LIKE against the lower()ed term instead of an
+-- ILIKE that folds every candidate row. lang_codes/mime_types are text[] so
+-- the language and mime_type filters are a GIN-indexed overlap (&&) with the
+-- requested values.
+-- Mirrors the book_search Table in app/models.py.
+--
+-- The catalog only changes on a dump reload; refresh afterwards (e.g. nightly):
+--   REFRESH MATERIALIZED VIEW CONCURRENTLY book_search;
+
+-- An earlier revision of this file built the view with mixed-case
+-- authors_text/topics_text; replace it, since IF NOT EXISTS would keep it.
+DO $$
+BEGIN
+    IF to_regclass('book_search') IS NOT NULL AND NOT EXISTS (
+        SELECT 1 FROM pg_attribute
+         WHERE attrelid = to_regclass('book_search')
+           AND attname = 'authors_lc' AND NOT attisdropped
+    ) THEN
+        DROP MATERIALIZED VIEW book_search;
+    END IF;
+END $$;
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS book_search AS
+SELECT
+    b.id,
+    lower((SELECT string_agg(a.name, E'\n')
+             FROM books_book_authors ba JOIN books_author a ON a.id = ba.author_id
+            WHERE ba.book_id = b.id)) AS authors_lc,
+    lower(concat_ws(E'\n',
+        (SELECT string_agg(s.name, E'\n')
+           FROM books_book_subjects bs JOIN books_subject s ON s.id = bs.subject_id
+          WHERE bs.book_id = b.id),
+        (SELECT string_agg(sh.name, E'\n')
+           FROM books_book_bookshelves bb JOIN books_bookshelf sh ON sh.id = bb.bookshelf_id
+          WHERE bb.book_id = b.id))) AS topics_lc,
+    ARRAY(SELECT l.code::text
+            FROM books_book_languages bl JOIN books_language l ON l.id = bl.language_id
+           WHERE bl.book_id = b.id) AS lang_codes,
+    ARRAY(SELECT DISTINCT f.mime_type::text
+            FROM books_format f
+           WHERE f.book_id = b.id) AS mime_types
+FROM books_book b;
+
+-- Unique index: required by REFRESH ... CONCURRENTLY, and the join key to books_book.
+CREATE UNIQUE INDEX IF NOT EXISTS ix_book_search_id ON book_search (id);
+CREATE INDEX IF NOT EXISTS ix_book_search_authors_lc_trgm
+    ON book_search USING gin (authors_lc gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS ix_book_search_topics_lc_trgm
+    ON book_search USING gin (topics_lc gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS ix_book_search_lang_codes
+    ON book_search USING gin (lang_codes);
+CREATE INDEX IF NOT EXISTS ix_book_search_mime_types
+    ON book_search USING gin (mime_types);
+
+ANALYZE book_search;
@@ -1,7 +1,10 @@
+import httpx
 import pytest
+import pytest_asyncio
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
 
 from app.database import Base, get_db
 from app.main import app
@@ -13,17 +16,87 @@ TEST_DATABASE_URL = settings.DATABASE_URL
 engine = create_engine(TEST_DATABASE_URL)
 TestingSessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False)
 
-@pytest.fixture
-def db_session():
-    db = TestingSessionLocal()
+def pytest_configure(config):
+    config.addinivalue_line(
+        "markers", "sqlite: runs against a throwaway in-memory SQLite database instead of Postgres"
+    )
+
+@pytest.fixture(scope="session")
+def connection():
+    # One connection and outer transaction for the run; nothing is ever committed.
+    conn = engine.connect()
+    outer = conn.begin()
+    try:
+        yield conn
+    finally:
+        outer.rollback()
+        conn.close()
+
+@pytest.fixture(scope="session")
+def db_session(connection):
+    # session.commit()/rollback() only release/roll back a SAVEPOINT inside the outer transaction
+    db = TestingSessionLocal(bind=connection, join_transaction_mode="create_savepoint")
     try:
         yield db
     finally:
         db.close()
 
-@pytest.fixture
-def client(db_session, monkeypatch):
+@pytest.fixture(scope="session")
+def client(db_session):
+    # One app client (and one startup/shutdown) for the whole run. The model
+    # preload is skipped: no test here needs a real LLM generation.
+    preload = settings.LLM_PRELOAD
+    settings.LLM_PRELOAD = False
     def override_get_db():
         yield db_session
-    monkeypatch.setattr("app.database.get_db", override_get_db)
-    return TestClient(app)
+    app.dependency_overrides[get_db] = override_get_db
+    try:
+        with TestClient(app) as c:
+            yield c
+    finally:
+        app.dependency_overrides.pop(get_db, None)
+        settings.LLM_PRELOAD = preload
+
+@pytest_asyncio.fixture
+async def async_client():
+    # For read-only tests that overlap requests with asyncio.gather. Concurrent
+    # requests cannot share db_session, so each one gets its own pooled session
+    # (never committed) for the duration of the test.
+    def per_request_db():
+        db = TestingSessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+    previous = app.dependency_overrides.get(get_db)
+    app.dependency_overrides[get_db] = per_request_db
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as c:
+        yield c
+    if previous is None:
+        app.dependency_overrides.pop(get_db, None)
+    else:
+        app.dependency_overrides[get_db] = previous
+
+@pytest.fixture(autouse=True)
+def _rollback_after_test(request):
+    # Per-test isolation on the shared session: undo whatever the test wrote.
+    yield
+    if "client" in request.fixturenames or "db_session" in request.fixturenames:
+        request.getfixturevalue("db_session").rollback()
+
+@pytest.fixture
+def sqlite_session(request):
+    # For tests that need no Postgres-specific SQL; mark them with @pytest.mark.sqlite.
+    if request.node.get_closest_marker("sqlite") is None:
+        pytest.fail("sqlite_session is only for tests marked @pytest.mark.sqlite")
+    sqlite_engine = create_engine(
+        "sqlite:///:memory:", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    Base.metadata.create_all(sqlite_engine)
+    db = sessionmaker(bind=sqlite_engine, autocommit=False, autoflush=False)()
+    try:
+        yield db
+    finally:
+        db.close()
+        sqlite_engine.dispose()
@@ -1,3 +1,11 @@
+import asyncio
+
+import pytest
+
+from app.llm import _fast_path_filter
+from app.main import _LANG_RE
+from app.models import Book, Language
+
 
 def test_known_title(client):
     response = client.get("/books?title=kennedy")
@@ -9,25 +17,27 @@ def test_download_count_field(client):
     for b in response.json()["results"]:
         assert isinstance(b["download_count"], int)  
 
-def test_subject_partial(client):
-    response = client.get("/books?topic=politics")
+@pytest.mark.parametrize("topic", ["politics", "POLITICS"])
+def test_subject_partial(client, topic):
+    # Should match on bookshelf or subject with "politics", whatever the case
+    response = client.get(f"/books?topic={topic}")
     assert response.status_code == 200
-    # Should match on bookshelf or subject with "politics"
     for book in response.json()["results"]:
-        names = [s["name"].lower() for s in book["subjects"] + book["bookshelves"]]
-        assert any("politics" in n for n in names)
+        assert any("politics" in n for n in book["topic_names"])
 
-def test_language_code(client):
+@pytest.mark.asyncio
+async def test_language_code(async_client):
     # Assuming 'en' exists from your dump
-    response = client.get("/books?language=en")
+    response = await async_client.get("/books?language=en")
     assert response.status_code == 200
     for book in response.json()["results"]:
         codes = [lang["code"] for lang in book["languages"]]
         assert "en" in codes
 
-def test_mime_type_real(client):
+@pytest.mark.asyncio
+async def test_mime_type_real(async_client):
     # Should return books with at least one format containing 'text/plain'
-    response = client.get("/books?mime_type=text/plain")
+    response = await async_client.get("/books?mime_type=text/plain")
     assert response.status_code == 200
     for book in response.json()["results"]:
         mime_types = [f["mime_type"] for f in book["formats"]]
@@ -42,13 +52,38 @@ def test_author_multi(client):
         names = [a["name"].lower() for a in b["authors"]]
         assert any("lincoln" in name for name in names)
 
-def test_pagination_skip(client):
+@pytest.mark.asyncio
+async def test_pagination_skip(async_client):
     # Get two pages and compare, should not repeat
-    page1 = client.get("/books?limit=2&skip=0").json()["results"]
-    page2 = client.get("/books?limit=2&skip=2").json()["results"]
+    r1, r2 = await asyncio.gather(
+        async_client.get("/books?limit=2&skip=0"), async_client.get("/books?limit=2&skip=2")
+    )
+    page1, page2 = r1.json()["results"], r2.json()["results"]
     if page1 and page2:
         assert page1[0]["id"] != page2[0]["id"]
 
+@pytest.mark.asyncio
+async def test_pagination_cursor(async_client):
+    # Following next_cursor continues the listing without repeats or gaps
+    r_both, r1 = await asyncio.gather(async_client.get("/books?limit=4"), async_client.get("/books?limit=2"))
+    both, page1 = r_both.json()["results"], r1.json()
+    page2 = (await async_client.get(f"/books?limit=2&cursor={page1['next_cursor']}")).json()
+    assert [b["id"] for b in page1["results"] + page2["results"]] == [b["id"] for b in both]
+    assert page2["count"] == page1["count"]
+
+def test_invalid_cursor(client):
+    response = client.get("/books?cursor=not-a-cursor")
+    assert response.status_code == 400
+
+def test_conditional_get(client):
+    # A repeat request presenting the ETag gets an empty 304
+    first = client.get("/books?limit=3")
+    etag = first.headers["etag"]
+    again = client.get("/books?limit=3", headers={"If-None-Match": etag})
+    assert again.status_code == 304
+    assert again.content == b""
+    assert client.get("/books?limit=3", headers={"If-None-Match": '"stale"'}).status_code == 200
+
 def test_multiple_filters_strong(client):
     # Find 'constitution' by author "United States" in English, with "Politics" subject
     response = client.get("/books?title=constitution&author=united&language=en&topic=politics")
@@ -56,17 +91,14 @@ def test_multiple_filters_strong(client):
     for book in response.json()["results"]:
         assert any("united" in a["name"].lower() for a in book["authors"])
         assert any(l["code"] == "en" for l in book["languages"])
-        found = False
-        for s in book["subjects"] + book["bookshelves"]:
-            if "politics" in s["name"].lower():
-                found = True
-        assert found
+        assert any("politics" in n for n in book["topic_names"])
 
 def test_empty_result(client):
     response = client.get("/books?author=zzzxnonexistentxxx")
     assert response.status_code == 200
-    assert response.json()["count"] == 0
-    assert response.json()["results"] == []
+    data = response.json()
+    assert data["count"] == 0
+    assert data["results"] == []
 
 def test_sorting_by_downloads(client):
     response = client.get("/books")
@@ -96,16 +128,6 @@ def test_missing_param_values(client):
     assert response.status_code == 200  # Should not crash or error
 
 
-def test_subject_case_insensitive(client):
-    response = client.get("/books?topic=POLITICS")
-    assert response.status_code == 200
-    for book in response.json()["results"]:
-        found = False
-        for s in book["subjects"] + book["bookshelves"]:
-            if "politics" in s["name"].lower():
-                found = True
-        assert found
-
 def test_download_links_exist(client):
     response = client.get("/books")
     for book in response.json()["results"]:
@@ -113,3 +135,51 @@ def test_download_links_exist(client):
         for f in book["formats"]:
             assert "url" in f and isinstance(f["url"], str)
 
+
+@pytest.mark.sqlite
+def test_models_roundtrip_sqlite(sqlite_session):
+    # Postgres-only DDL (pg_trgm, GIN and NULLS LAST indexes) is skipped on SQLite
+    book = Book(id=1, title="Sqlite Test", download_count=3, languages=[Language(id=1, code="en")])
+    sqlite_session.add(book)
+    sqlite_session.commit()
+    stored = sqlite_session.get(Book, 1)
+    assert stored.title == "Sqlite Test"
+    assert [l.code for l in stored.languages] == ["en"]
+
+@pytest.mark.parametrize("query", ["asdfghjkl", "", "   "])
+def test_chat_unsearchable_query(client, query):
+    # Gibberish and blank queries are answered without the LLM or the database
+    response = client.post("/chat", json={"query": query})
+    assert response.status_code == 200
+    data = response.json()
+    assert data["count"] == 0
+    assert data["results"] == []
+    assert "no books matched" in data["summary"].lower()
+
+@pytest.mark.parametrize("query, author", [
+    ("books by jane austen", ["jane austen"]),
+    ("top 10 books by downloads", None),
+    ("books sorted by popularity", None),
+])
+def test_fast_path_author(query, author):
+    # "by" followed by an ordering word is not an author filter
+    assert _fast_path_filter(query).get("author") == author
+
+@pytest.mark.parametrize("query, code", [
+    ("books in fr", "fr"),
+    ("is it any good", None),
+    ("democracy in america by alexis de tocqueville", None),
+])
+def test_chat_language_code(query, code):
+    # Codes that are also words only count after "in"/"language"
+    m = _LANG_RE.search(query)
+    assert (m and m.group(1)) == code
+
+@pytest.mark.parametrize("query, ids", [
+    ("books with ids 1342, 84 and 11", [1342, 84, 11]),
+    ("the #1 bestseller by dickens", None),
+    ("#1 most downloaded book", None),
+])
+def test_fast_path_ids(query, ids):
+    # Only "id"/"ids" introduce book ids; a "#1" ranking is not one
+    assert _fast_path_filter(query).get("ids") == ids